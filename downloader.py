@@ -4,7 +4,7 @@ import os
 import re
 import subprocess
 import sys
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 
 import requests
 from requests.auth import HTTPBasicAuth
@@ -74,50 +74,195 @@ def get_all_weeks(course_data: dict) -> List[int]:
     return course_data['courses'][0].get('sections', [])
 
 
-def get_unit_list(session: Session, section_ids: List[int]) -> List[List[int]]:
+def parse_ranges(spec: str) -> List[Tuple[int, Optional[int]]]:
+    """Parse a 1-based range list like ``1-3,5,8-`` into ``(start, end)`` pairs.
+
+    An open end (``8-``) is stored as ``None``.
+    """
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        m = re.fullmatch(r'(\d+)(?:\s*-\s*(\d*))?', part)
+        if not m or int(m.group(1)) < 1:
+            raise argparse.ArgumentTypeError(f'invalid range: {part!r}')
+        start = int(m.group(1))
+        if m.group(2) is None:
+            end = start
+        elif m.group(2) == '':
+            end = None
+        else:
+            end = int(m.group(2))
+            if end < start:
+                raise argparse.ArgumentTypeError(f'invalid range: {part!r}')
+        ranges.append((start, end))
+    return ranges
+
+
+def in_ranges(number: int, ranges: Optional[List[Tuple[int, Optional[int]]]]) -> bool:
+    """True if ``number`` is selected by ``ranges`` (no ranges selects everything)."""
+    if not ranges:
+        return True
+    return any(start <= number and (end is None or number <= end) for start, end in ranges)
+
+
+def parse_lesson_selectors(spec: str) -> Tuple[Set[int], List[re.Pattern]]:
+    """Split ``123,intro,Lecture \\d+`` into lesson ids and title patterns.
+
+    Commas separate selectors; a pattern needing one escapes it as ``\\,``.
+    """
+    ids, patterns = set(), []
+    for part in re.split(r'(?<!\\),', spec):
+        part = part.replace('\\,', ',').strip()
+        if not part:
+            continue
+        if part.isdigit():
+            ids.add(int(part))
+            continue
+        try:
+            patterns.append(re.compile(part, re.IGNORECASE))
+        except re.error as exc:
+            raise argparse.ArgumentTypeError(f'invalid lesson pattern {part!r}: {exc}')
+    if not ids and not patterns:
+        raise argparse.ArgumentTypeError(f'no lesson ids or patterns in {spec!r}')
+    return ids, patterns
+
+
+def get_unit_list(session: Session, section_ids: List[int]) -> List[Tuple[int, str, List[int]]]:
+    """Return ``(section_id, title, unit_ids)`` for each section that could be fetched."""
     if not section_ids:
         return []
-    # use repeated ids[] params per API requirement
+    # get_json requests each id separately: one call per section
     resp = get_json(session, f'{API_BASE}/sections', section_ids)
-    session.section = [s['sections'][0]['title'] for s in resp]
-    return [section['sections'][0]['units'] for section in resp]
+    return [(s['id'], s['title'], s['units']) for s in [u['sections'][0] for u in resp]]
 
 
-def get_steps_list(session: Session, units_list: List[List[int]], week_index: int) -> List[int]:
-    if week_index < 0 or week_index >= len(units_list):
-        return []
+def get_lessons_list(session: Session, unit_ids: List[int]) -> List[Tuple[int, Dict]]:
+    """Return ``(unit_pos, lesson)`` for all lessons of a week's units.
 
-    unit_ids = units_list[week_index]
+    Positions are 1-based and do not depend on the selection, so file names
+    stay stable.
+    """
     if not unit_ids:
         return []
 
     resp = get_json(session, f'{API_BASE}/units', unit_ids)
-    lesson_ids = [u['units'][0]['lesson'] for u in resp]
+    unit_pos = {unit_id: pos for pos, unit_id in enumerate(unit_ids, 1)}
+    lesson_pos = {}
+    for u in resp:
+        unit = u['units'][0]
+        lesson_pos[unit['lesson']] = unit_pos[unit['id']]
+
+    lesson_ids = sorted(lesson_pos, key=lesson_pos.get)
     if not lesson_ids:
         return []
 
     resp = get_json(session, f'{API_BASE}/lessons', lesson_ids)
-    steps = []
+    return [(lesson_pos[lesson['id']], lesson) for lesson in [u['lessons'][0] for u in resp]]
+
+
+def locate_lessons(
+    session: Session,
+    lesson_ids: Set[int],
+    section_ids: List[int],
+) -> List[Tuple[int, str, List[Tuple[int, Dict]]]]:
+    """Find the given lessons without crawling the whole course.
+
+    Each lesson's unit is looked up by lesson id, and only the sections
+    owning those units (restricted to ``section_ids``) are fetched.
+    Returns ``(section_id, title, [(unit_pos, lesson), ...])``.
+    """
+    if not lesson_ids:
+        return []
+
+    resp = get_json(session, f'{API_BASE}/lessons', sorted(lesson_ids))
+    owned: Dict[int, List[Tuple[int, Dict]]] = {}
     for lesson in [u['lessons'][0] for u in resp]:
-        steps.extend(lesson.get('steps', []))
-    return steps
+        units = get_json(session, f'{API_BASE}/units?lesson={lesson["id"]}').get('units', [])
+        # a lesson can be reused in other courses; keep the units of this one
+        for unit in units:
+            if unit['section'] in section_ids:
+                owned.setdefault(unit['section'], []).append((unit['id'], lesson))
+
+    located = []
+    for section_id, title, unit_ids in get_unit_list(session, [sid for sid in section_ids if sid in owned]):
+        lessons = [(unit_ids.index(unit_id) + 1, lesson)
+                   for unit_id, lesson in owned[section_id] if unit_id in unit_ids]
+        located.append((section_id, title, sorted(lessons, key=lambda item: item[0])))
+    return located
+
+
+def get_steps_list(
+    lessons_list: List[Tuple[int, Dict]],
+    lessons: Optional[Tuple[Set[int], List[re.Pattern]]] = None,
+    steps: Optional[List[Tuple[int, Optional[int]]]] = None,
+) -> List[Tuple[int, int, int]]:
+    """Return ``(unit_pos, step_pos, step_id)`` for the selected steps of a week."""
+    lesson_id_filter, title_patterns = lessons or (set(), [])
+    selected = []
+    for unit_pos, lesson in lessons_list:
+        if lessons is not None and not (
+            lesson['id'] in lesson_id_filter
+            or any(p.search(lesson.get('title', '')) for p in title_patterns)
+        ):
+            continue
+        for step_pos, step_id in enumerate(lesson.get('steps', []), 1):
+            if in_ranges(step_pos, steps):
+                selected.append((unit_pos, step_pos, step_id))
+    selected.sort()
+    return selected
 
 
-def get_only_video_steps(session: Session, step_ids: List[int]) -> List[Dict]:
-    if not step_ids:
+def get_only_video_steps(session: Session, steps: List[Tuple[int, int, int]]) -> List[Tuple[int, int, Dict]]:
+    """Fetch ``steps`` and keep ``(unit_pos, step_pos, block)`` for video ones."""
+    if not steps:
         return []
 
-    resp = get_json(session, f'{API_BASE}/steps', step_ids)
+    positions = {step_id: (unit_pos, step_pos) for unit_pos, step_pos, step_id in steps}
+    resp = get_json(session, f'{API_BASE}/steps', [step_id for _, _, step_id in steps])
     videos = []
     for step in [u['steps'][0] for u in resp]:
         block = step.get('block', {})
         video = block.get('video')
         if video:
-            videos.append(block)
+            videos.append(positions[step['id']] + (block,))
+    videos.sort(key=lambda v: v[:2])
     print('Only video:', len(videos))
     return videos
 
 
+def video_filename(unit_pos: int, step_pos: int) -> str:
+    return f'Video_{unit_pos:03d}_{step_pos:03d}.mp4'
+
+
+def migrate_old_names(week_dir: str, videos: List[Tuple[int, int, Dict]]) -> None:
+    """Rename ``Video_<i>.mp4`` files of earlier versions to the current names.
+
+    Earlier versions numbered the video steps of the week in order, which
+    matches ``videos`` only when the whole week is selected. An old file
+    whose video was already downloaded under the new name is removed.
+    """
+    for i, (unit_pos, step_pos, _) in enumerate(videos):
+        old = os.path.join(week_dir, f'Video_{i}.mp4')
+        new = os.path.join(week_dir, video_filename(unit_pos, step_pos))
+        if not os.path.isfile(old):
+            continue
+        if os.path.exists(new):
+            os.remove(old)
+        else:
+            os.replace(old, new)
+
+
+def write_concat_list(inp_path: str, names: List[str]) -> None:
+    with open(inp_path, 'w', encoding='utf-8') as inp:
+        for name in names:
+            inp.write(f"file '{name}'\n")
+
+
+def read_concat_list(inp_path: str) -> List[str]:
+    with open(inp_path, encoding='utf-8') as inp:
+        return re.findall(r"^file '(.+)'$", inp.read(), re.MULTILINE)
+
+
 def parse_arguments() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description='Stepik downloader')
     parser.add_argument('-c', '--client_id', required=True,
@@ -125,8 +270,13 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument('-s', '--client_secret', required=True,
                         help='your client_secret from https://stepik.org/oauth2/applications/')
     parser.add_argument('-i', '--course_id', required=True, help='course id')
-    parser.add_argument('-w', '--week_id', type=int, default=None,
-                        help='week number starting from 1 (downloads full course if omitted)')
+    parser.add_argument('-w', '--week_id', type=parse_ranges, default=None,
+                        help='weeks starting from 1, e.g. 3 or 1-3,5,8- (downloads full course if omitted)')
+    parser.add_argument('-l', '--lessons', type=parse_lesson_selectors, default=None,
+                        help='comma separated lesson ids and/or title regexps, e.g. 12345,intro '
+                             '(escape a comma inside a regexp as \\,)')
+    parser.add_argument('-t', '--steps', type=parse_ranges, default=None,
+                        help='step numbers within each lesson starting from 1, e.g. 1-3,5')
     parser.add_argument('-q', '--quality', choices=['360', '720', '1080'], default='720',
                         help='quality of a video. Default is 720')
     parser.add_argument('-o', '--output_dir', default='.',
@@ -144,8 +294,10 @@ def download_file(
 ) -> None:
     """Download a URL to destination using streaming with retries.
     If ``progress``/``task_id`` are supplied, the given task is updated
-    instead of creating a new display.
+    instead of creating a new display. ``dest`` is only replaced once the
+    download has completed.
     """
+    part = dest + '.part'
     attempt = 0
     while attempt < retries:
         try:
@@ -154,17 +306,18 @@ def download_file(
                 total = int(r.headers.get('content-length', 0))
                 if progress is not None and task_id is not None:
                     progress.update(task_id, total=total)
-                with open(dest, 'wb') as f:
+                with open(part, 'wb') as f:
                     for chunk in r.iter_content(chunk_size=8192):
                         if chunk:
                             f.write(chunk)
                             if progress is not None and task_id is not None:
                                 progress.update(task_id, advance=len(chunk))
+            os.replace(part, dest)
             return
         except (requests.exceptions.RequestException, IOError) as exc:
             attempt += 1
-            if os.path.exists(dest):
-                os.remove(dest)
+            if os.path.exists(part):
+                os.remove(part)
             if attempt < retries:
                 print(f"download failed ({exc}), retry {attempt}/{retries}...")
                 continue
@@ -178,9 +331,10 @@ def download_worker(
     dest: str,
     progress: Optional[Progress] = None,
     task_id: Optional[int] = None,
+    overwrite: bool = False,
 ) -> None:
-    """Thread target; skip if file already present."""
-    if os.path.isfile(dest):
+    """Thread target; skip if file already present unless ``overwrite`` is set."""
+    if os.path.isfile(dest) and not overwrite:
         return
     download_file(session, url, dest, progress=progress, task_id=task_id)
 
@@ -224,18 +378,30 @@ def main():
     course_name = sanitize_filename(course_data['courses'][0].get('title', args.course_id)).strip()
 
     weeks = get_all_weeks(course_data)
-    units = get_unit_list(session, weeks)
-    print('Units found:', units)
+    week_index = {section_id: idx for idx, section_id in enumerate(weeks)}
+    # only request the sections of the selected weeks
+    section_ids = [sid for idx, sid in enumerate(weeks) if in_ranges(idx + 1, args.week_id)]
+    lesson_ids, title_patterns = args.lessons or (set(), [])
+    if lesson_ids and not title_patterns:
+        # lesson ids alone: look the lessons up directly instead of crawling the weeks
+        week_lessons = locate_lessons(session, lesson_ids, section_ids)
+        found = {lesson['id'] for _, _, lessons in week_lessons for _, lesson in lessons}
+        not_found = sorted(lesson_ids - found)
+        if not_found:
+            print('Lessons not in the selected weeks of the course:', ', '.join(map(str, not_found)))
+    else:
+        sections = get_unit_list(session, section_ids)
+        print('Units found:', [unit_ids for _, _, unit_ids in sections])
+        week_lessons = [(section_id, title, get_lessons_list(session, unit_ids))
+                        for section_id, title, unit_ids in sections]
 
     base_dir = os.path.join(args.output_dir, course_name)
     os.makedirs(base_dir, exist_ok=True)
 
-    for week_idx in range(len(weeks)):
-        if args.week_id is not None and week_idx + 1 != args.week_id:
-            continue
-
-        steps = get_steps_list(session, units, week_idx)
-        print(f'Week {week_idx+1}: steps found:', steps)
+    for section_id, section_title, lessons_list in week_lessons:
+        week_idx = week_index[section_id]
+        steps = get_steps_list(lessons_list, args.lessons, args.steps)
+        print(f'Week {week_idx+1}: steps found:', [step_id for _, _, step_id in steps])
 
         videos = get_only_video_steps(session, steps)
         if not videos:
@@ -244,22 +410,24 @@ def main():
         week_dir = os.path.join(base_dir, f'week_{week_idx+1}')
         os.makedirs(week_dir, exist_ok=True)
         inp_path = os.path.join(week_dir, 'inp.txt')
+        partial = args.lessons is not None or args.steps is not None
+        if not partial:
+            migrate_old_names(week_dir, videos)
 
-        # build task list and write concat file
+        # build task list
         tasks: List[tuple] = []
-        with open(inp_path, 'w', encoding='utf-8') as inp:
-            for i, video in enumerate(videos):
-                urls = video['video'].get('urls', [])
-                chosen = next((u for u in urls if u.get('quality') == args.quality), None)
-                if chosen is None:
-                    chosen = urls[0]
-                    print(f"Requested quality {args.quality} not available; using {chosen.get('quality')}")
-                url = chosen['url']
-                filename = os.path.join(week_dir, f'Video_{i}.mp4')
-                inp.write(f"file 'Video_{i}.mp4'\n")
-                tasks.append((url, filename))
+        for unit_pos, step_pos, video in videos:
+            urls = video['video'].get('urls', [])
+            chosen = next((u for u in urls if u.get('quality') == args.quality), None)
+            if chosen is None:
+                chosen = urls[0]
+                print(f"Requested quality {args.quality} not available; using {chosen.get('quality')}")
+            url = chosen['url']
+            filename = os.path.join(week_dir, video_filename(unit_pos, step_pos))
+            tasks.append((url, filename))
 
         # download in parallel with a shared rich.Progress display
+        downloaded: List[str] = []
         if tasks:
             print(f"Downloading {len(tasks)} files using {MAX_DOWNLOAD_THREADS} threads")
             with cursor_hidden():
@@ -274,28 +442,52 @@ def main():
                     with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_THREADS) as executor:
                         future_map = {}
                         for url, fname in tasks:
-                            if os.path.isfile(fname):
+                            # a selective run is a re-download: replace what it selects
+                            if os.path.isfile(fname) and not partial:
                                 continue
                             tid = progress.add_task("", filename=os.path.basename(fname), total=0)
-                            fut = executor.submit(download_worker, session, url, fname, progress, tid)
+                            fut = executor.submit(download_worker, session, url, fname, progress, tid, partial)
                             future_map[fut] = fname
                         for fut in as_completed(future_map):
                             fname = future_map[fut]
                             try:
                                 fut.result()
+                                downloaded.append(fname)
                             except Exception as exc:
                                 print(f"Error while downloading {fname}: {exc}")
 
         print('All steps downloaded for week', week_idx+1)
 
-        # concat
+        # concat: the full list of the week is only known when the whole week
+        # is selected, partial runs reuse the list of the last full run
+        if not partial:
+            write_concat_list(inp_path, [os.path.basename(fname) for _, fname in tasks])
+            names = read_concat_list(inp_path)
+        else:
+            names = read_concat_list(inp_path) if os.path.isfile(inp_path) else []
+            # a list of an earlier version names its files Video_<i>.mp4
+            if any(re.fullmatch(r'Video_\d+\.mp4', n) for n in names) or any(
+                    os.path.basename(fname) not in names for fname in downloaded):
+                names = []
+            if not names:
+                print(f'Partial selection: run without --lessons/--steps to concat week {week_idx+1}')
+                continue
+        missing = [n for n in names if not os.path.isfile(os.path.join(week_dir, n))]
+        if missing:
+            print(f"Skip concat of week {week_idx+1}, missing: {', '.join(missing)}")
+            continue
+
         outputfilename = (
             os.path.join(args.output_dir, course_name, str(week_idx+1) + '. '
-                         + sanitize_filename(session.section[week_idx])).rstrip() + '.mp4'
+                         + sanitize_filename(section_title)).rstrip() + '.mp4'
         )
-        if not os.path.isfile(outputfilename):
+        # rebuild when a video is newer than the week video, e.g. re-downloaded
+        # by a partial run after the last concat
+        if (not os.path.isfile(outputfilename) or downloaded or any(
+                os.path.getmtime(os.path.join(week_dir, n)) > os.path.getmtime(outputfilename) for n in names)):
             print("Start concat by FFMPEG... " + outputfilename)
-            cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', inp_path, '-c', 'copy', outputfilename]
+            # -y: replace a concat made before some videos were re-downloaded
+            cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', inp_path, '-c', 'copy', outputfilename]
             log_path = os.path.join(week_dir, 'ffmpeg.log')
             try:
                 with open(log_path, 'w', encoding='utf-8') as log_file:
@@ -0,0 +1,235 @@
+import argparse
+import os
+import subprocess
+import sys
+
+import pytest
+
+import downloader
+
+
+WEEKS = list(range(1, 61))
+UNITS_PER_WEEK = 5
+
+
+@pytest.fixture
+def course(monkeypatch):
+    """A 60-week course served by a stubbed ``get_json`` that records its calls."""
+    sections = {s: {'id': s, 'title': f'Week {s}', 'units': [s * 10 + k for k in range(UNITS_PER_WEEK)]}
+                for s in WEEKS}
+    units = {u: {'id': u, 'section': s, 'lesson': u * 10}
+             for s in WEEKS for u in sections[s]['units']}
+    lessons = {u * 10: {'id': u * 10, 'title': f'Lecture {u}', 'steps': [u * 100 + 1, u * 100 + 2, u * 100 + 3]}
+               for u in units}
+    steps = {step_id: {'id': step_id, 'block': {} if step_id % 100 == 2 else
+                       {'video': {'urls': [{'quality': '720', 'url': f'https://video/{step_id}'}]}}}
+             for lesson in lessons.values() for step_id in lesson['steps']}
+    objects = {'sections': sections, 'units': units, 'lessons': lessons, 'steps': steps}
+    calls = []
+
+    def get_json(session, url, ids_list=None):
+        if ids_list is None:
+            calls.append(url)
+            lesson_id = int(url.split('lesson=')[1])
+            return {'units': [u for u in units.values() if u['lesson'] == lesson_id]}
+        kind = url.rsplit('/', 1)[1]
+        calls.extend(f'{url}/{i}' for i in ids_list)
+        return [{kind: [objects[kind][i]]} for i in ids_list if i in objects[kind]]
+
+    monkeypatch.setattr(downloader, 'get_json', get_json)
+    return objects, calls
+
+
+def test_parse_ranges():
+    assert downloader.parse_ranges('1-3,5') == [(1, 3), (5, 5)]
+    assert downloader.parse_ranges('8-') == [(8, None)]
+
+
+@pytest.mark.parametrize('spec', ['3-1', '0', '0-2', '', 'a', '1,,2'])
+def test_parse_ranges_invalid(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        downloader.parse_ranges(spec)
+
+
+def test_in_ranges():
+    ranges = downloader.parse_ranges('1-3,8-')
+    assert [n for n in range(1, 11) if downloader.in_ranges(n, ranges)] == [1, 2, 3, 8, 9, 10]
+    assert downloader.in_ranges(42, None)
+
+
+def test_parse_lesson_selectors():
+    ids, patterns = downloader.parse_lesson_selectors(r'123, intro ,Lecture \d{1\,2}$')
+    assert ids == {123}
+    assert [p.pattern for p in patterns] == ['intro', r'Lecture \d{1,2}$']
+    assert patterns[0].search('INTRO to it')
+
+
+@pytest.mark.parametrize('spec', ['', ',', ' , '])
+def test_parse_lesson_selectors_empty(spec):
+    with pytest.raises(argparse.ArgumentTypeError):
+        downloader.parse_lesson_selectors(spec)
+
+
+def test_video_filename_sorts_in_concat_order():
+    names = [downloader.video_filename(u, s) for u, s in [(10, 1), (2, 12), (2, 3)]]
+    assert sorted(names) == ['Video_002_003.mp4', 'Video_002_012.mp4', 'Video_010_001.mp4']
+
+
+def test_locate_lessons_by_id_is_cheap(course):
+    _, calls = course
+    located = downloader.locate_lessons(None, {4230}, WEEKS)
+    assert len(calls) == 3
+    assert [(sid, title, [(pos, lesson['id']) for pos, lesson in lessons])
+            for sid, title, lessons in located] == [(42, 'Week 42', [(4, 4230)])]
+
+
+def test_locate_lessons_respects_selected_weeks(course):
+    _, calls = course
+    assert downloader.locate_lessons(None, {4230}, [1, 2, 3]) == []
+    assert not any('/sections/' in url for url in calls)
+
+
+def test_get_unit_list_keeps_section_ids(course):
+    sections = downloader.get_unit_list(None, [2, 999, 3])
+    assert [(sid, title) for sid, title, _ in sections] == [(2, 'Week 2'), (3, 'Week 3')]
+
+
+def test_steps_selection_and_order(course):
+    lessons = downloader.get_lessons_list(None, [24, 20, 22])
+    selector = downloader.parse_lesson_selectors(r'Lecture 2[02]$')
+    steps = downloader.get_steps_list(lessons, selector, downloader.parse_ranges('2-'))
+    assert steps == [(2, 2, 2002), (2, 3, 2003), (3, 2, 2202), (3, 3, 2203)]
+
+    videos = downloader.get_only_video_steps(None, steps)
+    assert [v[:2] for v in videos] == [(2, 3), (3, 3)]
+
+
+def test_migrate_old_names(tmp_path):
+    videos = [(1, 1, {}), (1, 3, {}), (2, 1, {})]
+    for i in range(3):
+        (tmp_path / f'Video_{i}.mp4').write_text(str(i))
+    downloader.migrate_old_names(str(tmp_path), videos)
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'Video_001_001.mp4', 'Video_001_003.mp4', 'Video_002_001.mp4']
+    assert (tmp_path / 'Video_001_003.mp4').read_text() == '1'
+
+
+def test_concat_list_roundtrip(tmp_path):
+    inp_path = str(tmp_path / 'inp.txt')
+    names = ['Video_001_001.mp4', 'Video_002_003.mp4']
+    downloader.write_concat_list(inp_path, names)
+    assert downloader.read_concat_list(inp_path) == names
+
+
+class FakeSession:
+    def __init__(self):
+        self.headers = {}
+        self.proxies = {}
+
+    def post(self, *args, **kwargs):
+        return FakeResponse({'access_token': 'token'})
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def run_main(course, monkeypatch, tmp_path):
+    """Run ``main()`` offline; returns the downloaded files and ffmpeg commands."""
+    downloads, ffmpeg = [], []
+
+    def download_worker(session, url, dest, progress=None, task_id=None, overwrite=False):
+        if os.path.isfile(dest) and not overwrite:
+            return
+        downloads.append(os.path.basename(dest))
+        with open(dest, 'w') as f:
+            f.write(url)
+
+    def popen(cmd, **kwargs):
+        ffmpeg.append(cmd)
+        with open(cmd[-1], 'w') as f:
+            f.write('concat')
+
+    monkeypatch.setattr(downloader, 'make_session_with_retries', lambda **kwargs: FakeSession())
+    monkeypatch.setattr(downloader, 'get_course_page',
+                        lambda session, course_id: {'courses': [{'title': 'Course', 'sections': WEEKS}]})
+    monkeypatch.setattr(downloader, 'download_worker', download_worker)
+    monkeypatch.setattr(subprocess, 'Popen', popen)
+    monkeypatch.setattr(subprocess, 'CREATE_NO_WINDOW', 0, raising=False)
+
+    def run(*options):
+        downloads.clear()
+        ffmpeg.clear()
+        monkeypatch.setattr(sys, 'argv', ['downloader.py', '-c', 'id', '-s', 'secret', '-i', '1',
+                                          '-o', str(tmp_path), *options])
+        downloader.main()
+        return list(downloads), list(ffmpeg)
+
+    return run, tmp_path / 'Course'
+
+
+def test_main_full_then_partial_run(run_main, capsys):
+    run, course_dir = run_main
+    week_dir = course_dir / 'week_2'
+
+    downloads, ffmpeg = run('-w', '2')
+    assert sorted(downloads) == [downloader.video_filename(u, s) for u in range(1, 6) for s in (1, 3)]
+    assert downloader.read_concat_list(str(week_dir / 'inp.txt')) == sorted(downloads)
+    assert [cmd[-1] for cmd in ffmpeg] == [str(course_dir / '2. Week 2.mp4')]
+
+    downloads, ffmpeg = run('-w', '2')
+    assert (downloads, ffmpeg) == ([], [])
+
+    # re-downloading one lecture replaces its files and rebuilds the week
+    downloads, ffmpeg = run('--lessons', '220')
+    assert sorted(downloads) == ['Video_003_001.mp4', 'Video_003_003.mp4']
+    assert len(ffmpeg) == 1 and '-y' in ffmpeg[0]
+    assert downloader.read_concat_list(str(week_dir / 'inp.txt')) == [
+        downloader.video_filename(u, s) for u in range(1, 6) for s in (1, 3)]
+
+    run('--lessons', '220,999')
+    assert 'not in the selected weeks of the course: 999' in capsys.readouterr().out
+
+
+def test_main_partial_run_without_full_list(run_main, capsys):
+    run, course_dir = run_main
+    downloads, ffmpeg = run('--lessons', '220', '--steps', '3')
+    assert (downloads, ffmpeg) == (['Video_003_003.mp4'], [])
+    assert 'run without --lessons/--steps to concat week 2' in capsys.readouterr().out
+
+
+def test_main_old_format_directory(run_main, capsys):
+    run, course_dir = run_main
+    week_dir = course_dir / 'week_2'
+    week_dir.mkdir(parents=True)
+    old_names = [f'Video_{i}.mp4' for i in range(10)]
+    for name in old_names:
+        (week_dir / name).write_text('old')
+    downloader.write_concat_list(str(week_dir / 'inp.txt'), old_names)
+    (course_dir / '2. Week 2.mp4').write_text('old concat')
+    for path in [*week_dir.iterdir(), course_dir / '2. Week 2.mp4']:
+        os.utime(path, (1_000_000, 1_000_000))
+
+    # a partial run must not rebuild the week from the old files
+    downloads, ffmpeg = run('--lessons', '220')
+    assert (sorted(downloads), ffmpeg) == (['Video_003_001.mp4', 'Video_003_003.mp4'], [])
+    assert 'run without --lessons/--steps to concat week 2' in capsys.readouterr().out
+    assert (course_dir / '2. Week 2.mp4').read_text() == 'old concat'
+
+    # a full run migrates the old names instead of downloading them again,
+    # and rebuilds the week with the re-downloaded lecture
+    downloads, ffmpeg = run('-w', '2')
+    assert downloads == []
+    assert sorted(p.name for p in week_dir.glob('Video_*.mp4')) == [
+        downloader.video_filename(u, s) for u in range(1, 6) for s in (1, 3)]
+    assert (week_dir / 'Video_002_003.mp4').read_text() == 'old'
+    assert (week_dir / 'Video_003_001.mp4').read_text() == 'https://video/2201'
+    assert [cmd[-1] for cmd in ffmpeg] == [str(course_dir / '2. Week 2.mp4')]